@@ -0,0 +1,143 @@
+from datetime import datetime
+
+from sqlmodel import delete, insert, or_, select, tuple_, update
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from http_cache import if_match_fails, note_etag
+from models import Note
+from schemas import NoteBatchOperation, NoteBatchResult, NoteRead
+
+
+def _failure(index: int, op: NoteBatchOperation, status: int, detail: str) -> NoteBatchResult:
+    return NoteBatchResult(index=index, op=op.op, status=status, id=op.id, detail=detail)
+
+
+async def apply_batch(
+    session: AsyncSession,
+    user_id: int,
+    operations: list[NoteBatchOperation],
+) -> tuple[list[NoteBatchResult], set[int]]:
+    """
+    Apply mixed create/update/delete operations for one user with one
+    SELECT for the notes referenced, then at most one UPDATE claiming the
+    notes to write, one bulk INSERT, one executemany UPDATE and one DELETE,
+    and a single commit.
+
+    Operations are checked in order against the state left by the earlier
+    ones, so "update then delete" of a note works. An operation that fails
+    (404, 412, 422) is reported in its result and the rest still apply.
+    The SELECT may run before the write transaction starts, so the claim
+    re-checks every note about to be written: notes deleted meanwhile are
+    reported 404, and notes whose If-Match passed must still be at the
+    version read, or they are reported 412.
+    Returns the per-item results and the ids of notes that were changed.
+    """
+    now = datetime.utcnow().isoformat()
+    results: list[NoteBatchResult | None] = [None] * len(operations)
+
+    referenced = {op.id for op in operations if op.op != "create" and op.id is not None}
+    current: dict[int, dict] = {}
+    # note id -> updated_at an If-Match was checked against
+    guarded: dict[int, str] = {}
+    if referenced:
+        rows = await session.exec(
+            select(Note.id, Note.created_at, Note.updated_at)
+            .where(Note.id.in_(referenced), Note.user_id == user_id)
+        )
+        current = {row.id: {"created_at": row.created_at, "updated_at": row.updated_at} for row in rows}
+    checked = {note_id: state["updated_at"] for note_id, state in current.items()}
+
+    creates: list[tuple[int, dict]] = []
+    updates: dict[int, dict] = {}
+    deletes: set[int] = set()
+
+    for index, op in enumerate(operations):
+        if op.op in ("create", "update") and (op.title is None or op.content is None):
+            results[index] = _failure(index, op, 422, "title and content are required")
+            continue
+
+        if op.op == "create":
+            creates.append((index, {
+                "user_id": user_id,
+                "title": op.title,
+                "content": op.content,
+                "created_at": now,
+                "updated_at": now,
+            }))
+            continue
+
+        if op.id is None:
+            results[index] = _failure(index, op, 422, "id is required")
+            continue
+        state = current.get(op.id)
+        if state is None:
+            results[index] = _failure(index, op, 404, "Note not found")
+            continue
+        if if_match_fails(op.if_match, note_etag(op.id, state["updated_at"])):
+            results[index] = _failure(index, op, 412, "Note has been modified")
+            continue
+        if op.if_match is not None:
+            # Earlier operations in this batch only move the version forward
+            # from the one read, so that is what the write has to be guarded on
+            guarded[op.id] = checked[op.id]
+
+        if op.op == "update":
+            state["updated_at"] = now
+            # Several updates to one note collapse into the last one
+            updates[op.id] = {"id": op.id, "title": op.title, "content": op.content, "updated_at": now}
+            note = NoteRead(id=op.id, title=op.title, content=op.content, created_at=state["created_at"], updated_at=now)
+            results[index] = NoteBatchResult(index=index, op=op.op, status=200, id=op.id, note=note)
+        else:
+            del current[op.id]
+            updates.pop(op.id, None)
+            deletes.add(op.id)
+            results[index] = NoteBatchResult(index=index, op=op.op, status=204, id=op.id)
+
+    written = set(updates) | deletes
+    if written:
+        # Claim every note about to be written, re-checking guarded ones
+        # against the version read, and bump them in one statement. This
+        # takes the write lock (row locks on server databases), so nothing
+        # can change or delete the claimed notes before the commit.
+        unguarded = written - guarded.keys()
+        conditions = []
+        if guarded:
+            conditions.append(tuple_(Note.id, Note.updated_at).in_(list(guarded.items())))
+        if unguarded:
+            conditions.append(Note.id.in_(unguarded))
+        result = await session.exec(
+            update(Note)
+            .where(Note.user_id == user_id, or_(*conditions))
+            .values(updated_at=now)
+            .returning(Note.id)
+            .execution_options(synchronize_session=False)
+        )
+        lost = written - set(result.scalars().all())
+        for note_id in lost:
+            updates.pop(note_id, None)
+            deletes.discard(note_id)
+        for index, op in enumerate(operations):
+            if op.op != "create" and op.id in lost and results[index].status < 400:
+                if op.id in guarded:
+                    results[index] = _failure(index, op, 412, "Note has been modified")
+                else:
+                    results[index] = _failure(index, op, 404, "Note not found")
+
+    if creates:
+        # One multi-row INSERT. RETURNING rows come back in no particular order,
+        # but the ids are handed out ascending in VALUES order, so sort them.
+        # (sort_by_parameter_order would fall back to one INSERT per row on SQLite.)
+        result = await session.exec(insert(Note).returning(Note.id), params=[values for _, values in creates])
+        for (index, values), note_id in zip(creates, sorted(result.scalars().all())):
+            note = NoteRead(id=note_id, **values)
+            results[index] = NoteBatchResult(index=index, op="create", status=201, id=note_id, note=note)
+
+    if updates:
+        # ORM bulk UPDATE by primary key, sent as one executemany
+        await session.exec(update(Note), params=list(updates.values()))
+
+    if deletes:
+        await session.exec(delete(Note).where(Note.id.in_(deletes), Note.user_id == user_id))
+
+    await session.commit()
+    return results, set(updates) | deletes
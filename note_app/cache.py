@@ -0,0 +1,166 @@
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Any
+
+try:
+    import redis.asyncio as Redis
+    from redis.exceptions import RedisError
+except ImportError:  # redis is only needed for the shared layer
+    Redis = None
+    RedisError = Exception
+
+# e.g. redis://localhost:6379/0. Unset keeps every cache per-process only.
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL")
+# How long Redis remembers a key's invalidations; a read-through fill that
+# takes longer than this could still store a stale value.
+GENERATION_TTL = 3600
+
+# Store the value only if the key's generation is still the one the caller
+# saw before reading the source of truth.
+SET_IF_GENERATION = """
+if (redis.call('GET', KEYS[2]) or '') == ARGV[1] then
+    redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+end
+"""
+
+
+class TTLCache:
+    """
+    In-process LRU cache whose entries also expire after `ttl` seconds.
+    """
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+
+    def get(self, key: str) -> Any | None:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        self.entries[key] = (time.monotonic() + self.ttl, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        self.entries.pop(key, None)
+
+    def clear(self) -> None:
+        self.entries.clear()
+
+
+class Cache:
+    """
+    A cache shared by every worker through Redis when a redis_url is given,
+    otherwise a per-process TTLCache.
+
+    There is deliberately no local layer in front of Redis: a delete could
+    only clear it in the current worker, and every other worker would keep
+    serving its copy until the TTL ran out. Values must be JSON serialisable.
+    Redis failures are treated as misses so the cache never takes requests
+    down with it.
+
+    Read-through callers take a fill_token() before reading the source of
+    truth and store the result with fill(), which skips it if the key was
+    deleted in between instead of caching what was just replaced.
+    """
+    def __init__(self, namespace: str, ttl: float, maxsize: int, redis_url: str | None = CACHE_REDIS_URL):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.local = None
+        self.redis = None
+        # Deletes seen by the local cache, see fill_token()
+        self.invalidations = 0
+        if redis_url:
+            if Redis is None:
+                raise RuntimeError("CACHE_REDIS_URL is set but the redis package is not installed")
+            self.redis = Redis.from_url(redis_url, decode_responses=True)
+            self.set_if_generation = self.redis.register_script(SET_IF_GENERATION)
+        else:
+            self.local = TTLCache(maxsize, ttl)
+
+    def _redis_key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    def _generation_key(self, key: str) -> str:
+        return f"{self.namespace}:generation:{key}"
+
+    async def fill_token(self, key: str) -> str | int | None:
+        """
+        Take before reading the value to cache. Locally this is a counter of
+        all deletes, which keeps no per-key state at the cost of skipping a
+        fill that raced with a delete of any key; in Redis it is the key's
+        own generation. None means the fill should be skipped.
+        """
+        if self.redis is None:
+            return self.invalidations
+        try:
+            return await self.redis.get(self._generation_key(key)) or ""
+        except RedisError:
+            return None
+
+    async def get(self, key: str) -> Any | None:
+        if self.redis is None:
+            return self.local.get(key)
+
+        try:
+            raw = await self.redis.get(self._redis_key(key))
+        except RedisError:
+            return None
+        return None if raw is None else json.loads(raw)
+
+    async def set(self, key: str, value: Any) -> None:
+        if self.redis is None:
+            self.local.set(key, value)
+            return
+        try:
+            await self.redis.set(self._redis_key(key), json.dumps(value), ex=max(1, int(self.ttl)))
+        except RedisError:
+            pass
+
+    async def fill(self, key: str, value: Any, token: str | int | None) -> None:
+        """
+        Store a value read through from the source of truth, unless the key
+        was deleted since `token` was taken with fill_token().
+        """
+        if self.redis is None:
+            if token == self.invalidations:
+                self.local.set(key, value)
+            return
+        if token is None:
+            return
+        try:
+            await self.set_if_generation(
+                keys=[self._redis_key(key), self._generation_key(key)],
+                args=[token, json.dumps(value), max(1, int(self.ttl))],
+            )
+        except RedisError:
+            pass
+
+    async def delete(self, key: str) -> None:
+        if self.redis is None:
+            self.invalidations += 1
+            self.local.delete(key)
+            return
+        try:
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.incr(self._generation_key(key))
+                pipe.expire(self._generation_key(key), GENERATION_TTL)
+                pipe.delete(self._redis_key(key))
+                await pipe.execute()
+        except RedisError:
+            pass
+
+    async def close(self) -> None:
+        if self.redis is not None:
+            await self.redis.close()
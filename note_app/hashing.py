@@ -0,0 +1,91 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from passlib.context import CryptContext
+
+# Changing BCRYPT_ROUNDS makes existing hashes "need update"; they are
+# rehashed with the new cost the next time their owner logs in.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# Leave a core for the event loop by default
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(max(1, (os.cpu_count() or 2) - 1))))
+# Hashes allowed to wait for a worker before new ones are turned away
+PASSWORD_HASH_QUEUE_SIZE = int(os.getenv("PASSWORD_HASH_QUEUE_SIZE", "32"))
+PASSWORD_HASH_RETRY_AFTER = int(os.getenv("PASSWORD_HASH_RETRY_AFTER", "1"))
+
+password_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+
+# These run inside the worker processes, so they must stay module level.
+def hash_password(password: str) -> str:
+    return password_context.hash(password)
+
+
+def verify_and_update(plain_password: str, hashed_password: str) -> tuple[bool, str | None]:
+    return password_context.verify_and_update(plain_password, hashed_password)
+
+
+def _warm_up() -> None:
+    pass
+
+
+class PasswordHashPoolFull(Exception):
+    def __init__(self, retry_after: int = PASSWORD_HASH_RETRY_AFTER):
+        super().__init__("Password hashing is at capacity")
+        self.retry_after = retry_after
+
+
+class PasswordHashPool:
+    """
+    Runs bcrypt in a dedicated process pool so it neither holds the GIL nor
+    fills the threadpool that request handlers use. At most
+    `workers + queue_size` calls are in flight; beyond that callers get
+    PasswordHashPoolFull straight away instead of queueing without bound.
+    """
+    def __init__(self, workers: int = PASSWORD_HASH_WORKERS, queue_size: int = PASSWORD_HASH_QUEUE_SIZE):
+        self.workers = workers
+        self.capacity = workers + queue_size
+        self.in_flight = 0
+        self.executor: ProcessPoolExecutor | None = None
+
+    def start(self) -> None:
+        if self.executor is not None:
+            return
+        # spawn avoids forking a process that already runs an event loop and threads
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+        # Start every worker now rather than on the first logins
+        for _ in range(self.workers):
+            self.executor.submit(_warm_up)
+
+    def shutdown(self) -> None:
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+            self.executor = None
+
+    async def _run(self, func, *args):
+        if self.in_flight >= self.capacity:
+            raise PasswordHashPoolFull()
+
+        self.start()
+        self.in_flight += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+        finally:
+            self.in_flight -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run(hash_password, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> tuple[bool, str | None]:
+        """
+        Check a password; the second item is a replacement hash when the
+        stored one was made with outdated cost parameters.
+        """
+        return await self._run(verify_and_update, plain_password, hashed_password)
+
+
+password_hash_pool = PasswordHashPool()
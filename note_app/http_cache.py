@@ -0,0 +1,60 @@
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+
+
+def note_etag(note_id: int, updated_at: str) -> str:
+    """
+    Strong ETag for a note version. updated_at changes on every write, so it
+    identifies the representation without hashing the content.
+    """
+    digest = hashlib.sha1(f"{note_id}:{updated_at}".encode()).hexdigest()[:20]
+    return f'"{digest}"'
+
+
+def _as_utc(updated_at: str) -> datetime:
+    # Timestamps are stored as naive UTC isoformat strings
+    return datetime.fromisoformat(updated_at).replace(tzinfo=timezone.utc)
+
+
+def last_modified(updated_at: str) -> str:
+    return format_datetime(_as_utc(updated_at), usegmt=True)
+
+
+def _etags(header: str) -> list[str]:
+    return [tag.strip() for tag in header.split(",") if tag.strip()]
+
+
+def is_not_modified(headers, etag: str, updated_at: str) -> bool:
+    """
+    Evaluate If-None-Match, or If-Modified-Since when no ETags were sent,
+    against the current version of a resource.
+    """
+    if_none_match = headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = _etags(if_none_match)
+        # If-None-Match uses weak comparison
+        return "*" in tags or etag in [tag.removeprefix("W/") for tag in tags]
+
+    if_modified_since = headers.get("if-modified-since")
+    if if_modified_since is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    # HTTP dates only have second precision
+    return _as_utc(updated_at).replace(microsecond=0) <= since
+
+
+def if_match_fails(if_match: str | None, etag: str) -> bool:
+    """
+    True when an If-Match header was sent and none of its ETags matches.
+    """
+    if if_match is None:
+        return False
+    tags = _etags(if_match)
+    # If-Match uses strong comparison, so weak tags never match
+    return "*" not in tags and etag not in tags
@@ -0,0 +1,34 @@
+import uuid
+from locust import HttpUser, task, constant
+
+# Load test for the note API, run with:
+#   locust -f locust_file.py --host http://localhost:8000
+# Compare the requests/s column between runs to measure a change.
+
+
+class NoteUser(HttpUser):
+    wait_time = constant(0)
+
+    def on_start(self):
+        """
+        Register a fresh user and create a note to read back.
+        """
+        email = f"{uuid.uuid4().hex}@example.com"
+        response = self.client.post("/register", json={"email": email, "hashed_password": "password"})
+        token = response.json()["access_token"]
+        self.client.headers.update({"Authorization": f"Bearer {token}"})
+
+        response = self.client.post("/notes", json={"title": "Load test", "content": "Hello"})
+        self.note_id = response.json()["id"]
+
+    @task(8)
+    def read_note(self):
+        self.client.get(f"/notes/{self.note_id}", name="/notes/{id}")
+
+    @task(2)
+    def create_note(self):
+        self.client.post("/notes", json={"title": "Load test", "content": "x" * 200})
+
+    @task(1)
+    def update_note(self):
+        self.client.put(f"/notes/{self.note_id}", json={"title": "Updated", "content": "x" * 200}, name="/notes/{id}")
@@ -1,35 +1,73 @@
 # Note app with aauthentication and CRUD operations
 # learn to add rate limiting
 # authentication with JWT
-from fastapi import FastAPI, HTTPException, status, Depends
+import os
+from fastapi import FastAPI, HTTPException, status, Depends, Header, Query, Request, Response
+from fastapi.responses import JSONResponse
 from fastapi.security import OAuth2PasswordRequestForm
 from datetime import datetime
-from sqlmodel import SQLModel, Session, select
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import SQLModel, select, tuple_, update
+from sqlmodel.ext.asyncio.session import AsyncSession
+from batch import apply_batch
 from db import engine, get_session
+from cache import Cache
 from contextlib import asynccontextmanager
+from hashing import PasswordHashPoolFull, password_hash_pool
+from http_cache import if_match_fails, is_not_modified, last_modified, note_etag
 from models import Note, User
-from schemas import NoteCreate, NoteRead, UserCreate, UserRead
-from security import AuthHandler, PasswordHasher, get_user
+from pagination import decode_cursor, encode_cursor
+from schemas import NoteBatchRequest, NoteBatchResponse, NoteCreate, NotePage, NoteRead, NoteSearchPage, Principal, UserCreate, UserRead
+from search import create_search_index, search_notes
+from security import AuthHandler, get_current_user, get_user, invalidate_principal, principal_cache
+
+# Read-through cache of NoteRead payloads, off unless NOTE_CACHE_TTL is set.
+# Without CACHE_REDIS_URL every worker caches on its own, so with several
+# workers one may serve a note up to NOTE_CACHE_TTL seconds stale after
+# another updates it. Set CACHE_REDIS_URL when running more than one worker.
+NOTE_CACHE_TTL = float(os.getenv("NOTE_CACHE_TTL", "0"))
+NOTE_CACHE_SIZE = int(os.getenv("NOTE_CACHE_SIZE", "10000"))
+note_cache = Cache("note", NOTE_CACHE_TTL, NOTE_CACHE_SIZE) if NOTE_CACHE_TTL > 0 else None
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup code here
-    SQLModel.metadata.create_all(engine)
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+        await conn.run_sync(create_search_index)
+    password_hash_pool.start()
 
     yield
     # Shutdown code here
+    password_hash_pool.shutdown()
+    await principal_cache.close()
+    if note_cache:
+        await note_cache.close()
+    await engine.dispose()
 
 app = FastAPI(lifespan=lifespan)
 
 
+@app.exception_handler(PasswordHashPoolFull)
+async def password_hash_pool_full_handler(request, exc: PasswordHashPoolFull):
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Too many authentication requests, try again shortly"},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
 
 @app.post("/register", status_code=status.HTTP_201_CREATED)
-def create_user(data: UserCreate, session: Session = Depends(get_session)):
-    db_user = get_user(data.email, session)
+async def create_user(data: UserCreate, session: AsyncSession = Depends(get_session)):
+    db_user = await get_user(data.email, session)
     if db_user:
         raise HTTPException(status_code=400, detail="Email already registered")
     
-    hashed_password = PasswordHasher.hash_password(data.hashed_password)
+    # bcrypt is CPU bound, keep it off the event loop and the threadpool, and
+    # give the connection back to the pool while it runs
+    await session.close()
+    hashed_password = await password_hash_pool.hash(data.hashed_password)
 
     user = User(
         email=data.email,
@@ -39,27 +77,135 @@ def create_user(data: UserCreate, session: Session = Depends(get_session)):
     )
     
     session.add(user)
-    session.commit()
-    session.refresh(user)
+    try:
+        await session.commit()
+    except IntegrityError:
+        # Another sign-up for this email won the race while we were hashing
+        await session.rollback()
+        raise HTTPException(status_code=400, detail="Email already registered")
+    await session.refresh(user)
 
     access_token = AuthHandler().create_access_token(data={"sub": user.email})
     
     return {"access_token": access_token, "token_type": "bearer", "data": UserRead.model_validate(user)}
 
 @app.post("/token")
-def login(credentials: OAuth2PasswordRequestForm = Depends(), session: Session =Depends(get_session)):
+async def login(credentials: OAuth2PasswordRequestForm = Depends(), session: AsyncSession = Depends(get_session)):
    
-    user = get_user(credentials.username, session)
+    user = await get_user(credentials.username, session)
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid username or password")
 
-    if not user or not PasswordHasher.verify_password(credentials.password, user.hashed_password):
+    # Don't hold a connection while bcrypt runs, or a login burst starves note requests
+    await session.close()
+    verified, new_hash = await password_hash_pool.verify(credentials.password, user.hashed_password)
+    if not verified:
         raise HTTPException(status_code=401, detail="Invalid username or password")
 
+    # The stored hash used outdated cost parameters, upgrade it while we have the password
+    if new_hash:
+        user.hashed_password = new_hash
+        user.updated_at = datetime.utcnow().isoformat()
+        session.add(user)
+        await session.commit()
+        await invalidate_principal(user.email)
+
     access_token = AuthHandler().create_access_token(data={"sub": user.email})
     return {"access_token": access_token, "token_type": "bearer"}
 
+async def get_user_note(note_id: int, user: Principal, session: AsyncSession) -> Note:
+    note = await session.get(Note, note_id)
+    # Other users' notes are reported as missing rather than forbidden
+    if not note or note.user_id != user.id:
+        raise HTTPException(status_code=404, detail="Note not found")
+    return note
+
+async def get_note_payload(note_id: int, user: Principal, session: AsyncSession) -> dict:
+    if note_cache:
+        cached = await note_cache.get(str(note_id))
+        if cached is not None:
+            if cached["user_id"] != user.id:
+                raise HTTPException(status_code=404, detail="Note not found")
+            return cached["note"]
+        # Taken before the read, so an update committed meanwhile stops the fill
+        token = await note_cache.fill_token(str(note_id))
+
+    note = await get_user_note(note_id, user, session)
+    payload = NoteRead.model_validate(note).model_dump()
+    if note_cache:
+        await note_cache.fill(str(note_id), {"user_id": note.user_id, "note": payload}, token)
+    return payload
+
+async def invalidate_note(note_id: int):
+    if note_cache:
+        await note_cache.delete(str(note_id))
+
+def validator_headers(note_id: int, updated_at: str) -> dict:
+    return {
+        "ETag": note_etag(note_id, updated_at),
+        "Last-Modified": last_modified(updated_at),
+        # Clients may keep a copy but must revalidate it before use
+        "Cache-Control": "private, no-cache",
+    }
+
+@app.get("/notes", response_model=NotePage)
+async def list_notes(
+    cursor: str | None = None,
+    limit: int = Query(20, ge=1, le=100),
+    current_user: Principal = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session),
+):
+    # Newest first, paginated on (updated_at, id) so every page is an index range scan
+    statement = (
+        select(Note)
+        .where(Note.user_id == current_user.id)
+        .order_by(Note.updated_at.desc(), Note.id.desc())
+        .limit(limit + 1)
+    )
+    if cursor:
+        try:
+            updated_at, note_id = decode_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        statement = statement.where(tuple_(Note.updated_at, Note.id) < tuple_(updated_at, note_id))
+
+    notes = list((await session.exec(statement)).all())
+
+    next_cursor = None
+    if len(notes) > limit:
+        notes = notes[:limit]
+        next_cursor = encode_cursor(notes[-1].updated_at, notes[-1].id)
+
+    return NotePage(items=notes, next_cursor=next_cursor)
+
+# Registered before /notes/{note_id} so "search" isn't taken for a note id
+@app.get("/notes/search", response_model=NoteSearchPage)
+async def search(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0, le=10000),
+    current_user: Principal = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session),
+):
+    if engine.dialect.name != "sqlite":
+        raise HTTPException(status_code=status.HTTP_501_NOT_IMPLEMENTED, detail="Search requires SQLite FTS5")
+
+    try:
+        hits = await search_notes(session, current_user.id, q, limit + 1, offset)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid search query")
+
+    next_offset = None
+    if len(hits) > limit:
+        hits = hits[:limit]
+        next_offset = offset + limit
+
+    return NoteSearchPage(items=hits, next_offset=next_offset)
+
 @app.post("/notes", response_model=NoteRead)
-def create_note(note: NoteCreate, session: Session = Depends(get_session)):
+async def create_note(note: NoteCreate, response: Response, current_user: Principal = Depends(get_current_user), session: AsyncSession = Depends(get_session)):
     note = Note(
+        user_id=current_user.id,
         title=note.title,
         content=note.content,
         created_at=datetime.utcnow().isoformat(),
@@ -67,43 +213,82 @@ def create_note(note: NoteCreate, session: Session = Depends(get_session)):
     )
 
     session.add(note)
-    session.commit()
-    session.refresh(note)   
+    await session.commit()
+    await session.refresh(note)   
 
+    response.headers.update(validator_headers(note.id, note.updated_at))
     return note
 
+@app.post("/notes/batch", response_model=NoteBatchResponse)
+async def batch_notes(batch: NoteBatchRequest, current_user: Principal = Depends(get_current_user), session: AsyncSession = Depends(get_session)):
+    # Lets offline clients sync many edits in one round trip and one commit
+    results, changed_ids = await apply_batch(session, current_user.id, batch.operations)
+
+    for note_id in changed_ids:
+        await invalidate_note(note_id)
+
+    return NoteBatchResponse(results=results)
+
 @app.get("/notes/{note_id}", response_model=NoteRead)
-def read_note(note_id: int, session: Session = Depends(get_session)):
+async def read_note(note_id: int, request: Request, current_user: Principal = Depends(get_current_user), session: AsyncSession = Depends(get_session)):
 
-    note = session.get(Note, note_id)
-    if not note:
-        raise HTTPException(status_code=404, detail="Note not found")
-    return note
+    note = await get_note_payload(note_id, current_user, session)
+    headers = validator_headers(note["id"], note["updated_at"])
+
+    if is_not_modified(request.headers, headers["ETag"], note["updated_at"]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    # The payload is already a validated NoteRead, skip re-serializing it
+    return JSONResponse(content=note, headers=headers)
 
 @app.put("/notes/{note_id}", response_model=NoteRead)
-def update_note(note_id: int, note_data: NoteCreate, session: Session = Depends(get_session)):
-    note = session.get(Note, note_id)
-    if not note:
+async def update_note(
+    note_id: int,
+    note_data: NoteCreate,
+    response: Response,
+    if_match: str | None = Header(None),
+    current_user: Principal = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session),
+):
+    note = await get_user_note(note_id, current_user, session)
+    modified = HTTPException(status_code=status.HTTP_412_PRECONDITION_FAILED, detail="Note has been modified")
+
+    # Optimistic concurrency: refuse to overwrite a version the client hasn't seen
+    if if_match_fails(if_match, note_etag(note.id, note.updated_at)):
+        raise modified
+
+    statement = update(Note).where(Note.id == note.id).values(
+        title=note_data.title,
+        content=note_data.content,
+        updated_at=datetime.utcnow().isoformat(),
+    )
+    if if_match is not None:
+        # Compare-and-set on the version just checked, so two writers holding
+        # the same ETag can't both succeed
+        statement = statement.where(Note.updated_at == note.updated_at)
+
+    result = await session.exec(statement)
+    if result.rowcount == 0:
+        await session.rollback()
+        if if_match is not None:
+            raise modified
+        # Without a precondition the only way to miss is a concurrent delete
         raise HTTPException(status_code=404, detail="Note not found")
-        
-    note.title = note_data.title
-    note.content = note_data.content
-    note.updated_at = datetime.utcnow().isoformat()
-    
-    session.add(note)
-    session.commit()
-    session.refresh(note)
+
+    await session.commit()
+    await session.refresh(note)
+    await invalidate_note(note_id)
     
+    response.headers.update(validator_headers(note.id, note.updated_at))
     return note
 
 @app.delete("/notes/{note_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_note(note_id: int, session: Session = Depends(get_session)):
+async def delete_note(note_id: int, current_user: Principal = Depends(get_current_user), session: AsyncSession = Depends(get_session)):
 
-    note = session.get(Note, note_id)
-    if not note:
-        raise HTTPException(status_code=404, detail="Note not found")
+    note = await get_user_note(note_id, current_user, session)
         
-    session.delete(note)
-    session.commit()
+    await session.delete(note)
+    await session.commit()
+    await invalidate_note(note_id)
     
     return None
\ No newline at end of file
@@ -1,14 +1,18 @@
-from sqlmodel import SQLModel, Field
+from sqlmodel import SQLModel, Field, Index
 
 class User(SQLModel, table=True):
     id: int | None = Field(default=None, primary_key=True)
-    email: str
+    email: str = Field(index=True, unique=True)
     hashed_password: str
     created_at: str
     updated_at: str
 
 class Note(SQLModel, table=True):
+    # Serves both "notes of a user" lookups and keyset pagination on (updated_at, id)
+    __table_args__ = (Index("ix_note_user_id_updated_at_id", "user_id", "updated_at", "id"),)
+
     id: int | None = Field(default=None, primary_key=True)
+    user_id: int = Field(foreign_key="user.id")
     title: str
     content: str
     created_at: str
@@ -0,0 +1,25 @@
+import base64
+import json
+
+
+def encode_cursor(updated_at: str, note_id: int) -> str:
+    """
+    Pack the (updated_at, id) of the last note on a page into an opaque token.
+    """
+    raw = json.dumps([updated_at, note_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[str, int]:
+    """
+    Reverse encode_cursor, raising ValueError for anything malformed.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        updated_at, note_id = json.loads(raw)
+    except (ValueError, TypeError) as exc:
+        raise ValueError("Invalid cursor") from exc
+
+    if not isinstance(updated_at, str) or not isinstance(note_id, int):
+        raise ValueError("Invalid cursor")
+    return updated_at, note_id
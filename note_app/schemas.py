@@ -1,5 +1,5 @@
 from sqlmodel import SQLModel, Field
-from typing import Optional
+from typing import Literal, Optional
 
 
 class NoteBase(SQLModel):
@@ -14,6 +14,18 @@ class NoteRead(NoteBase):
     created_at: str
     updated_at: str
 
+class NotePage(SQLModel):
+    items: list[NoteRead]
+    next_cursor: Optional[str] = None
+
+class NoteSearchResult(NoteRead):
+    title_highlight: str
+    snippet: str
+
+class NoteSearchPage(SQLModel):
+    items: list[NoteSearchResult]
+    next_offset: Optional[int] = None
+
 class UserBase(SQLModel):
     email: str
 
@@ -23,4 +35,31 @@ class UserCreate(UserBase):
 class UserRead(UserBase):
     id: int
     created_at: str
-    updated_at: str
\ No newline at end of file
+    updated_at: str
+
+class Principal(SQLModel):
+    """The authenticated user as seen by request handlers."""
+    id: int
+    email: str
+
+class NoteBatchOperation(SQLModel):
+    op: Literal["create", "update", "delete"]
+    id: Optional[int] = None
+    title: Optional[str] = None
+    content: Optional[str] = None
+    # ETag the client last saw; the operation fails with 412 if the note has changed since
+    if_match: Optional[str] = None
+
+class NoteBatchRequest(SQLModel):
+    operations: list[NoteBatchOperation] = Field(min_length=1, max_length=1000)
+
+class NoteBatchResult(SQLModel):
+    index: int
+    op: str
+    status: int
+    id: Optional[int] = None
+    note: Optional[NoteRead] = None
+    detail: Optional[str] = None
+
+class NoteBatchResponse(SQLModel):
+    results: list[NoteBatchResult]
\ No newline at end of file
@@ -0,0 +1,103 @@
+import unicodedata
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+from sqlalchemy.exc import OperationalError
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+# External content FTS5 index over note.title/note.content. The rows live
+# only in `note`; triggers keep the index in step with every insert, update
+# and delete, whichever code path makes them. user_id is indexed too so a
+# search is narrowed to one user inside FTS instead of after ranking.
+SEARCH_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS note_fts USING fts5(
+        title, content, user_id,
+        content='note', content_rowid='id',
+        tokenize='porter unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS note_fts_ai AFTER INSERT ON note BEGIN
+        INSERT INTO note_fts(rowid, title, content, user_id)
+        VALUES (new.id, new.title, new.content, new.user_id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS note_fts_ad AFTER DELETE ON note BEGIN
+        INSERT INTO note_fts(note_fts, rowid, title, content, user_id)
+        VALUES ('delete', old.id, old.title, old.content, old.user_id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS note_fts_au AFTER UPDATE OF title, content, user_id ON note BEGIN
+        INSERT INTO note_fts(note_fts, rowid, title, content, user_id)
+        VALUES ('delete', old.id, old.title, old.content, old.user_id);
+        INSERT INTO note_fts(rowid, title, content, user_id)
+        VALUES (new.id, new.title, new.content, new.user_id);
+    END
+    """,
+]
+
+# Title matches count ten times as much as content matches; user_id not at all
+SEARCH_SQL = text("""
+    SELECT note.id, note.title, note.content, note.created_at, note.updated_at,
+           highlight(note_fts, 0, '<mark>', '</mark>') AS title_highlight,
+           snippet(note_fts, 1, '<mark>', '</mark>', '…', 16) AS snippet
+    FROM note_fts
+    JOIN note ON note.id = note_fts.rowid
+    WHERE note_fts MATCH :query AND note.user_id = :user_id
+    ORDER BY bm25(note_fts, 10.0, 1.0, 0.0), note.id
+    LIMIT :limit OFFSET :offset
+""")
+
+
+def create_search_index(conn: Connection) -> None:
+    """
+    Create the FTS table and its triggers, indexing existing notes the first
+    time. Other databases have no FTS5, so this is a no-op for them.
+    """
+    if conn.dialect.name != "sqlite":
+        return
+
+    exists = conn.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'note_fts'"
+    ).first()
+    for statement in SEARCH_DDL:
+        conn.exec_driver_sql(statement)
+    if not exists:
+        conn.exec_driver_sql("INSERT INTO note_fts(note_fts) VALUES ('rebuild')")
+
+
+def build_match_query(q: str, user_id: int) -> str | None:
+    """
+    Turn free text into an FTS5 query. Every word is quoted, so FTS operators
+    and column filters typed by the user are matched literally and cannot
+    widen the search beyond their own notes.
+    """
+    terms = []
+    for word in q.split():
+        # FTS5 rejects some control characters (NUL ends the string early)
+        word = "".join(ch for ch in word if not unicodedata.category(ch).startswith("C"))
+        if word:
+            terms.append('"{}"'.format(word.replace('"', '""')))
+    if not terms:
+        return None
+    return f'user_id:"{user_id}" AND ({" ".join(terms)})'
+
+
+async def search_notes(session: AsyncSession, user_id: int, q: str, limit: int, offset: int) -> list[dict]:
+    query = build_match_query(q, user_id)
+    if query is None:
+        return []
+
+    try:
+        result = await session.exec(
+            SEARCH_SQL,
+            params={"query": query, "user_id": user_id, "limit": limit, "offset": offset},
+        )
+    except OperationalError as exc:
+        # Anything build_match_query still lets through is a bad query, not a server error
+        await session.rollback()
+        raise ValueError("Invalid search query") from exc
+    return [dict(row) for row in result.mappings()]
@@ -4,26 +4,23 @@ from fastapi import Depends, HTTPException, status
 import jwt
 from jwt import PyJWTError, InvalidTokenError
 from datetime import datetime, timedelta
-from passlib.context import CryptContext
-from sqlmodel import Session, select
+import os
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from cache import Cache
+from db import get_session
 from models import User
+from schemas import Principal
 
 SECRET_KEY = "your_secret_key"
 ALGORITHM = "HS256"    
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-password_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
-
+# How long a verified user is trusted without going back to the database
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", "60"))
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
 
-class PasswordHasher:
-    @staticmethod
-    def hash_password(password: str) -> str:
-        return password_context.hash(password)
-    
-    @staticmethod
-    def verify_password(plain_password: str, hashed_password: str) -> bool:
-        return password_context.verify(plain_password, hashed_password)
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 
 class AuthHandler:
@@ -42,15 +39,17 @@ class AuthHandler:
             return None
 
 auth_handler = AuthHandler()
+# Keyed by the token subject (the user's email)
+principal_cache = Cache("principal", PRINCIPAL_CACHE_TTL, PRINCIPAL_CACHE_SIZE)
 
 
-def get_user(email: str, session: Session):
+async def get_user(email: str, session: AsyncSession):
     statement = select(User).where(User.email == email)
-    results = session.exec(statement)
+    results = await session.exec(statement)
     return results.first()
 
 
-def get_current_user(token: Annotated[str, Depends(oauth2_scheme)], session: Session = Depends()):
+async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)], session: AsyncSession = Depends(get_session)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -61,5 +60,21 @@ def get_current_user(token: Annotated[str, Depends(oauth2_scheme)], session: Ses
     if token_data is None:
         raise credentials_exception
     
-    user = get_user(token_data, session)
-    return user
\ No newline at end of file
+    cached = await principal_cache.get(token_data)
+    if cached is not None:
+        return Principal.model_validate(cached)
+
+    user = await get_user(token_data, session)
+    if user is None:
+        raise credentials_exception
+
+    principal = Principal(id=user.id, email=user.email)
+    await principal_cache.set(token_data, principal.model_dump())
+    return principal
+
+
+async def invalidate_principal(email: str):
+    """
+    Drop a cached principal; call whenever the user row changes.
+    """
+    await principal_cache.delete(email)
\ No newline at end of file
@@ -0,0 +1,445 @@
+"""
+Synthetic-data benchmark for the spill_app geo endpoints.
+
+The FastAPI app is driven in-process through httpx's ASGI transport, so the
+numbers measure the handlers plus their Redis/Mongo calls rather than the
+network stack. Data lives either in in-memory stand-ins (`--backend memory`)
+or in local Redis/Mongo instances such as the ones from docker-compose
+(`--backend local`, which uses a separate Redis db and Mongo database).
+
+Every run is written to `--output-dir` as JSON; pass an earlier result to
+`--compare` to flag throughput or latency regressions between versions.
+
+Usage:
+    python benchmark.py --points 1000000 --distribution clustered,uniform
+    python benchmark.py --backend local --compare bench_results/<run>.json
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Dict, Iterable, List, Tuple
+
+import httpx
+import redis.asyncio as Redis
+from bson import ObjectId
+from pymongo import AsyncMongoClient
+
+from geo_index import GEO_KEY
+from main import app
+
+# (min_lat, min_lng, max_lat, max_lng) the synthetic stories are spread over
+DEFAULT_BBOX = (4.0, 2.7, 13.9, 14.7)
+KM_PER_DEGREE = 111.32
+# Same earth radius Redis uses for its geo commands
+EARTH_RADIUS_KM = 6372.7976
+
+RESULT_SIZE_BUCKETS = [(0, 0), (1, 10), (11, 100), (101, 1000), (1001, None)]
+
+
+# ---------------------------------------------------------------------------
+# Synthetic data
+# ---------------------------------------------------------------------------
+
+class PointSampler:
+    """
+    Draws (latitude, longitude) pairs either uniformly over a bounding box or
+    clustered around a fixed set of random centres, like stories in cities.
+    Queries are drawn from the same distribution as the data.
+    """
+    def __init__(self, distribution: str, seed: int, clusters: int = 50, spread_km: float = 3.0, bbox=DEFAULT_BBOX):
+        self.distribution = distribution
+        self.rng = random.Random(seed)
+        self.bbox = bbox
+        self.spread_km = spread_km
+        self.centres = [self._uniform() for _ in range(clusters)]
+
+    def _uniform(self) -> Tuple[float, float]:
+        min_lat, min_lng, max_lat, max_lng = self.bbox
+        return self.rng.uniform(min_lat, max_lat), self.rng.uniform(min_lng, max_lng)
+
+    def sample(self) -> Tuple[float, float]:
+        if self.distribution == "uniform":
+            return self._uniform()
+
+        centre_lat, centre_lng = self.rng.choice(self.centres)
+        lat = centre_lat + self.rng.gauss(0, self.spread_km / KM_PER_DEGREE)
+        lng = centre_lng + self.rng.gauss(0, self.spread_km / (KM_PER_DEGREE * math.cos(math.radians(centre_lat))))
+        return max(-85.0, min(85.0, lat)), max(-180.0, min(180.0, lng))
+
+
+# ---------------------------------------------------------------------------
+# In-memory stand-ins for the Redis/Mongo calls spill_app makes
+# ---------------------------------------------------------------------------
+
+def _haversine_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    dlat = math.radians(lat2 - lat1)
+    dlng = math.radians(lng2 - lng1)
+    a = math.sin(dlat / 2) ** 2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlng / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+class MemoryGeoRedis:
+    """
+    Grid-bucketed geo set supporting the GEOADD/GEORADIUS calls used by the app.
+    """
+    CELL_DEGREES = 0.1
+
+    def __init__(self):
+        self.keys: Dict[str, Dict[Tuple[int, int], Dict[str, Tuple[float, float]]]] = defaultdict(lambda: defaultdict(dict))
+
+    def _cell(self, lat: float, lng: float) -> Tuple[int, int]:
+        return int(math.floor(lat / self.CELL_DEGREES)), int(math.floor(lng / self.CELL_DEGREES))
+
+    async def geoadd(self, name: str, values: Iterable[Any]) -> int:
+        values = list(values)
+        grid = self.keys[name]
+        for i in range(0, len(values), 3):
+            lng, lat, member = values[i], values[i + 1], values[i + 2]
+            grid[self._cell(lat, lng)][member] = (lat, lng)
+        return len(values) // 3
+
+    async def georadius(self, name: str, longitude: float, latitude: float, radius: float, unit: str = "km") -> List[str]:
+        grid = self.keys.get(name, {})
+        dlat = radius / KM_PER_DEGREE
+        dlng = radius / (KM_PER_DEGREE * max(math.cos(math.radians(latitude)), 1e-6))
+        min_row, min_col = self._cell(latitude - dlat, longitude - dlng)
+        max_row, max_col = self._cell(latitude + dlat, longitude + dlng)
+
+        members = []
+        for row in range(min_row, max_row + 1):
+            for col in range(min_col, max_col + 1):
+                for member, (lat, lng) in grid.get((row, col), {}).items():
+                    if _haversine_km(latitude, longitude, lat, lng) <= radius:
+                        members.append(member)
+        return members
+
+    async def delete(self, *names: str) -> int:
+        return sum(1 for name in names if self.keys.pop(name, None) is not None)
+
+    async def close(self) -> None:
+        pass
+
+
+class _MemoryCursor:
+    def __init__(self, docs: List[Dict[str, Any]]):
+        self.docs = docs
+
+    async def __aiter__(self):
+        for doc in self.docs:
+            yield doc
+
+
+class MemoryCollection:
+    """
+    Dict-backed collection supporting insert_one/insert_many and `_id: {$in}` finds.
+    """
+    def __init__(self):
+        self.docs: Dict[ObjectId, Dict[str, Any]] = {}
+
+    async def insert_one(self, document: Dict[str, Any]):
+        document.setdefault("_id", ObjectId())
+        self.docs[document["_id"]] = dict(document)
+        return SimpleNamespace(inserted_id=document["_id"])
+
+    async def insert_many(self, documents: List[Dict[str, Any]]):
+        inserted_ids = []
+        for document in documents:
+            inserted_ids.append((await self.insert_one(document)).inserted_id)
+        return SimpleNamespace(inserted_ids=inserted_ids)
+
+    def find(self, query: Dict[str, Any]) -> _MemoryCursor:
+        ids = query["_id"]["$in"]
+        return _MemoryCursor([dict(self.docs[i]) for i in ids if i in self.docs])
+
+    async def drop(self) -> None:
+        self.docs.clear()
+
+
+class MemoryDatabase:
+    def __init__(self):
+        self.spill = MemoryCollection()
+
+
+# ---------------------------------------------------------------------------
+# Backends and seeding
+# ---------------------------------------------------------------------------
+
+async def open_backend(args: argparse.Namespace):
+    if args.backend == "memory":
+        return MemoryGeoRedis(), MemoryDatabase(), None
+
+    redis = Redis.from_url(args.redis_url, decode_responses=True)
+    mongo_client = AsyncMongoClient(args.mongo_url)
+    return redis, mongo_client[args.mongo_db], mongo_client
+
+
+async def seed(redis, db, sampler: PointSampler, count: int, batch_size: int = 10000) -> None:
+    """
+    Load `count` synthetic stories straight into the stores, bypassing HTTP.
+    """
+    await db.spill.drop()
+    await redis.delete(GEO_KEY)
+
+    for start in range(0, count, batch_size):
+        docs = []
+        for _ in range(min(batch_size, count - start)):
+            lat, lng = sampler.sample()
+            docs.append({"content": "synthetic story", "latitude": lat, "longitude": lng})
+
+        result = await db.spill.insert_many(docs)
+        values = []
+        for story_id, doc in zip(result.inserted_ids, docs):
+            values.extend((doc["longitude"], doc["latitude"], str(story_id)))
+        await redis.geoadd(GEO_KEY, values)
+
+
+# ---------------------------------------------------------------------------
+# Measurement
+# ---------------------------------------------------------------------------
+
+def percentile(sorted_values: List[float], pct: float) -> float | None:
+    if not sorted_values:
+        return None
+    rank = max(0, math.ceil(pct / 100 * len(sorted_values)) - 1)
+    return sorted_values[rank]
+
+
+def summarize(latencies_ms: List[float]) -> Dict[str, Any]:
+    values = sorted(latencies_ms)
+    return {
+        "count": len(values),
+        "p50_ms": percentile(values, 50),
+        "p95_ms": percentile(values, 95),
+        "p99_ms": percentile(values, 99),
+        "mean_ms": sum(values) / len(values) if values else None,
+    }
+
+
+def _bucket_name(size: int) -> str:
+    for low, high in RESULT_SIZE_BUCKETS:
+        if size >= low and (high is None or size <= high):
+            return f"{low}+" if high is None else f"{low}-{high}"
+    return "unknown"
+
+
+async def run_scenario(
+    client: httpx.AsyncClient,
+    sampler: PointSampler,
+    radius_km: int,
+    write_ratio: float,
+    requests: int,
+    concurrency: int,
+) -> Dict[str, Any]:
+    reads: List[float] = []
+    writes: List[float] = []
+    result_sizes: List[int] = []
+    by_result_size: Dict[str, List[float]] = defaultdict(list)
+    errors = 0
+    budget = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for _ in budget:
+            lat, lng = sampler.sample()
+            is_write = sampler.rng.random() < write_ratio
+            start = time.perf_counter()
+            if is_write:
+                response = await client.post("/stories/", json={"content": "bench", "latitude": lat, "longitude": lng})
+            else:
+                response = await client.get("/stories/", params={"latitude": lat, "longitude": lng, "radius_km": radius_km})
+            elapsed_ms = (time.perf_counter() - start) * 1000
+
+            if response.status_code != 200:
+                errors += 1
+                continue
+            if is_write:
+                writes.append(elapsed_ms)
+            else:
+                size = len(response.json()["stories"])
+                reads.append(elapsed_ms)
+                result_sizes.append(size)
+                by_result_size[_bucket_name(size)].append(elapsed_ms)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    duration = time.perf_counter() - started
+
+    result_sizes.sort()
+    return {
+        "name": f"{sampler.distribution}/r{radius_km}km/w{write_ratio:g}",
+        "distribution": sampler.distribution,
+        "radius_km": radius_km,
+        "write_ratio": write_ratio,
+        "requests": requests,
+        "concurrency": concurrency,
+        "duration_s": duration,
+        "throughput_rps": (len(reads) + len(writes)) / duration if duration else None,
+        "errors": errors,
+        "read": summarize(reads),
+        "write": summarize(writes),
+        "result_size": {
+            "p50": percentile(result_sizes, 50),
+            "p99": percentile(result_sizes, 99),
+            "max": result_sizes[-1] if result_sizes else None,
+        },
+        "read_by_result_size": {bucket: summarize(values) for bucket, values in sorted(by_result_size.items())},
+    }
+
+
+# ---------------------------------------------------------------------------
+# Reporting
+# ---------------------------------------------------------------------------
+
+def _fmt(value: float | None) -> str:
+    return "-" if value is None else f"{value:.2f}"
+
+
+def print_report(scenarios: List[Dict[str, Any]]) -> None:
+    header = f"{'scenario':<32} {'req/s':>9} {'p50':>8} {'p95':>8} {'p99':>8} {'w p95':>8} {'rows p50':>9} {'err':>5}"
+    print(header)
+    print("-" * len(header))
+    for s in scenarios:
+        print(
+            f"{s['name']:<32} {_fmt(s['throughput_rps']):>9} {_fmt(s['read']['p50_ms']):>8} "
+            f"{_fmt(s['read']['p95_ms']):>8} {_fmt(s['read']['p99_ms']):>8} {_fmt(s['write']['p95_ms']):>8} "
+            f"{_fmt(s['result_size']['p50']):>9} {s['errors']:>5}"
+        )
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold_pct: float) -> List[str]:
+    """
+    Return a line per scenario whose throughput dropped or whose read/write
+    p95 grew by more than `threshold_pct` against the baseline run.
+    """
+    previous = {s["name"]: s for s in baseline["scenarios"]}
+    regressions = []
+    for scenario in current["scenarios"]:
+        old = previous.get(scenario["name"])
+        if old is None:
+            continue
+
+        checks = [
+            ("throughput_rps", old["throughput_rps"], scenario["throughput_rps"], -1),
+            ("read p95_ms", old["read"]["p95_ms"], scenario["read"]["p95_ms"], 1),
+            ("write p95_ms", old["write"]["p95_ms"], scenario["write"]["p95_ms"], 1),
+        ]
+        for metric, before, after, direction in checks:
+            if not before or after is None:
+                continue
+            change_pct = (after - before) / before * 100
+            if change_pct * direction > threshold_pct:
+                regressions.append(f"{scenario['name']}: {metric} {before:.2f} -> {after:.2f} ({change_pct:+.1f}%)")
+    return regressions
+
+
+def git_revision() -> str:
+    try:
+        # Ask the checkout this file lives in, not whatever directory we were run from
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=Path(__file__).resolve().parent,
+            text=True,
+            stderr=subprocess.DEVNULL,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+# ---------------------------------------------------------------------------
+# Entry point
+# ---------------------------------------------------------------------------
+
+def parse_args(argv: List[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark spill_app geo reads and writes on synthetic data")
+    parser.add_argument("--backend", choices=["memory", "local"], default="memory")
+    parser.add_argument("--redis-url", default="redis://localhost:6379/15")
+    parser.add_argument("--mongo-url", default="mongodb://localhost:27017")
+    parser.add_argument("--mongo-db", default="spill_bench")
+    parser.add_argument("--points", type=int, default=100_000, help="Stories to seed per distribution")
+    parser.add_argument("--distribution", default="clustered,uniform", help="Comma separated: clustered, uniform")
+    parser.add_argument("--radii", default="1,5,25", help="Comma separated search radii in km")
+    parser.add_argument("--write-ratios", default="0,0.1,0.5", help="Comma separated fraction of requests that are writes")
+    parser.add_argument("--requests", type=int, default=2000, help="Requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--warmup", type=int, default=200, help="Unrecorded reads before each distribution")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--label", default=None, help="Name stored with the results, defaults to the git revision")
+    parser.add_argument("--output-dir", default="bench_results")
+    parser.add_argument("--compare", default=None, help="Earlier result file to check for regressions")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Regression threshold in percent")
+    return parser.parse_args(argv)
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    redis, db, mongo_client = await open_backend(args)
+    app.state.redis = redis
+    app.state.db = db
+
+    scenarios = []
+    transport = httpx.ASGITransport(app=app)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for distribution in args.distribution.split(","):
+                sampler = PointSampler(distribution.strip(), args.seed)
+                print(f"Seeding {args.points} {sampler.distribution} stories...")
+                await seed(redis, db, sampler, args.points)
+
+                await run_scenario(client, sampler, 5, 0.0, args.warmup, args.concurrency)
+                for radius in (int(r) for r in args.radii.split(",")):
+                    for write_ratio in (float(w) for w in args.write_ratios.split(",")):
+                        scenarios.append(
+                            await run_scenario(client, sampler, radius, write_ratio, args.requests, args.concurrency)
+                        )
+    finally:
+        await redis.close()
+        if mongo_client is not None:
+            await mongo_client.close()
+
+    revision = git_revision()
+    return {
+        "label": args.label or revision,
+        "git_revision": revision,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "config": {
+            key: getattr(args, key)
+            for key in ("backend", "points", "distribution", "radii", "write_ratios", "requests", "concurrency", "seed")
+        },
+        "scenarios": scenarios,
+    }
+
+
+def main(argv: List[str] | None = None) -> int:
+    args = parse_args(argv)
+    results = asyncio.run(run(args))
+    print_report(results["scenarios"])
+
+    output_dir = Path(args.output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    output_file = output_dir / f"{stamp}_{results['label']}_{args.backend}.json"
+    output_file.write_text(json.dumps(results, indent=2))
+    print(f"Results written to {output_file}")
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text())
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"Regressions against {baseline['label']}:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print(f"No regressions against {baseline['label']} above {args.threshold}%")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,221 @@
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Tuple
+
+import redis.asyncio as Redis
+from bson import ObjectId
+from pymongo.asynchronous.collection import AsyncCollection
+from redis.asyncio.lock import Lock
+from redis.exceptions import LockNotOwnedError
+
+GEO_KEY = "stories_geo"
+REBUILD_LOCK_KEY = "stories_geo:rebuild:lock"
+CONSISTENCY_LOCK_KEY = "stories_geo:consistency:lock"
+# Also the lifetime of a rebuild's temp key, so a worker killed mid-rebuild
+# cannot leave a full copy of the index behind for good.
+REBUILD_TIMEOUT = 3600
+
+# Documents pulled from Mongo per round trip, and members sent per GEOADD.
+BATCH_SIZE = 5000
+GEOADD_CHUNK = 500
+
+# Redis only accepts latitudes inside the Web Mercator range.
+MAX_LATITUDE = 85.05112878
+
+GEO_PROJECTION = {"_id": 1, "latitude": 1, "longitude": 1}
+
+
+def _geo_member(doc: Dict[str, Any]) -> Tuple[float, float, str] | None:
+    """
+    Turn a story document into a (lng, lat, member) triple, or None if its
+    coordinates cannot be stored in a Redis geo set.
+    """
+    latitude = doc.get("latitude")
+    longitude = doc.get("longitude")
+    if not isinstance(latitude, (int, float)) or not isinstance(longitude, (int, float)):
+        return None
+    if abs(latitude) > MAX_LATITUDE or abs(longitude) > 180:
+        return None
+    return (longitude, latitude, str(doc["_id"]))
+
+
+async def _load_batch(
+    redis: Redis.Redis,
+    key: str,
+    members: List[Tuple[float, float, str]],
+    expire: int | None = None,
+) -> None:
+    """
+    Send one batch of members to Redis as pipelined GEOADDs, optionally
+    (re)setting the key's expiry in the same round trip.
+    """
+    async with redis.pipeline(transaction=False) as pipe:
+        for start in range(0, len(members), GEOADD_CHUNK):
+            values = []
+            for member in members[start:start + GEOADD_CHUNK]:
+                values.extend(member)
+            pipe.geoadd(key, values)
+        if expire is not None:
+            pipe.expire(key, expire)
+        await pipe.execute()
+
+
+async def _stream_into(
+    redis: Redis.Redis,
+    collection: AsyncCollection,
+    key: str,
+    query: Dict[str, Any],
+    batch_size: int,
+    expire: int | None = None,
+) -> Dict[str, int]:
+    indexed = 0
+    skipped = 0
+    batch: List[Tuple[float, float, str]] = []
+
+    cursor = collection.find(query, projection=GEO_PROJECTION, batch_size=batch_size)
+    async for doc in cursor:
+        member = _geo_member(doc)
+        if member is None:
+            skipped += 1
+            continue
+        batch.append(member)
+        if len(batch) >= batch_size:
+            await _load_batch(redis, key, batch, expire)
+            indexed += len(batch)
+            batch = []
+
+    if batch:
+        await _load_batch(redis, key, batch, expire)
+        indexed += len(batch)
+
+    return {"indexed": indexed, "skipped": skipped}
+
+
+async def _release(lock: Lock) -> None:
+    try:
+        await lock.release()
+    except LockNotOwnedError:
+        # The job outlived the lock timeout and the lock already expired;
+        # that must not hide the job's own result or error.
+        pass
+
+
+async def rebuild_geo_index(
+    redis: Redis.Redis,
+    collection: AsyncCollection,
+    batch_size: int = BATCH_SIZE,
+) -> Dict[str, Any]:
+    """
+    Rebuild `stories_geo` from the stories collection.
+
+    The index is loaded into a temporary key and swapped in with RENAME, so
+    readers see either the old index or the complete new one. Stories created
+    while the rebuild was running are replayed onto the live key afterwards.
+    Only one rebuild runs at a time across workers.
+    """
+    lock = redis.lock(REBUILD_LOCK_KEY, timeout=REBUILD_TIMEOUT, blocking=False)
+    if not await lock.acquire():
+        return {"status": "already_running", "indexed": None, "skipped": None}
+
+    temp_key = f"{GEO_KEY}:rebuild:{uuid.uuid4().hex}"
+    # ObjectIds embed their creation second; leave some slack for clock skew.
+    started = ObjectId.from_datetime(datetime.now(timezone.utc) - timedelta(seconds=5))
+
+    try:
+        stats = await _stream_into(redis, collection, temp_key, {}, batch_size, expire=REBUILD_TIMEOUT)
+
+        if stats["indexed"]:
+            # RENAME carries the temp key's expiry over, so drop it atomically
+            async with redis.pipeline(transaction=True) as pipe:
+                pipe.rename(temp_key, GEO_KEY)
+                pipe.persist(GEO_KEY)
+                await pipe.execute()
+        else:
+            await redis.delete(GEO_KEY)
+
+        # GEOADD is idempotent, so re-adding stories already in the index is harmless.
+        await _stream_into(redis, collection, GEO_KEY, {"_id": {"$gte": started}}, batch_size)
+    finally:
+        await redis.delete(temp_key)
+        await _release(lock)
+
+    return {"status": "ok", **stats}
+
+
+async def warm_geo_index(redis: Redis.Redis, collection: AsyncCollection) -> Dict[str, Any] | None:
+    """
+    Rebuild the index only if it is missing, e.g. after Redis was restarted
+    or flushed. Returns None when the index is already present.
+    """
+    if await redis.exists(GEO_KEY):
+        return None
+    return await rebuild_geo_index(redis, collection)
+
+
+async def _add_ids(redis: Redis.Redis, key: str, ids: List[str]) -> None:
+    async with redis.pipeline(transaction=False) as pipe:
+        # Equal scores keep the set in lexical order, which ZRANGE samples use
+        pipe.zadd(key, dict.fromkeys(ids, 0))
+        pipe.expire(key, REBUILD_TIMEOUT)
+        await pipe.execute()
+
+
+async def check_geo_consistency(
+    redis: Redis.Redis,
+    collection: AsyncCollection,
+    sample_size: int = 20,
+) -> Dict[str, Any]:
+    """
+    Compare the story ids in Mongo with the members of `stories_geo` and
+    report the drift between the two stores.
+
+    Mongo ids are streamed into a temporary sorted set and diffed against
+    the index with ZDIFFSTORE, so neither side is held in worker memory.
+    Only one check runs at a time across workers.
+    """
+    lock = redis.lock(CONSISTENCY_LOCK_KEY, timeout=REBUILD_TIMEOUT, blocking=False)
+    if not await lock.acquire():
+        return {"status": "already_running"}
+
+    prefix = f"{GEO_KEY}:consistency:{uuid.uuid4().hex}"
+    mongo_key, missing_key, orphaned_key = f"{prefix}:mongo", f"{prefix}:missing", f"{prefix}:orphaned"
+
+    try:
+        mongo_count = 0
+        ids: List[str] = []
+        async for doc in collection.find({}, projection={"_id": 1}, batch_size=BATCH_SIZE):
+            ids.append(str(doc["_id"]))
+            if len(ids) >= BATCH_SIZE:
+                await _add_ids(redis, mongo_key, ids)
+                mongo_count += len(ids)
+                ids = []
+        if ids:
+            await _add_ids(redis, mongo_key, ids)
+            mongo_count += len(ids)
+
+        async with redis.pipeline(transaction=True) as pipe:
+            pipe.zcard(GEO_KEY)
+            pipe.zdiffstore(missing_key, [mongo_key, GEO_KEY])
+            pipe.zdiffstore(orphaned_key, [GEO_KEY, mongo_key])
+            redis_count, missing, orphaned = await pipe.execute()
+
+        missing_sample: List[str] = []
+        orphaned_sample: List[str] = []
+        if sample_size:
+            missing_sample = await redis.zrange(missing_key, 0, sample_size - 1)
+            # Orphans keep their geohash scores, so sort the sample for stable output
+            orphaned_sample = sorted(await redis.zrange(orphaned_key, 0, sample_size - 1))
+    finally:
+        await redis.delete(mongo_key, missing_key, orphaned_key)
+        await _release(lock)
+
+    return {
+        "status": "ok",
+        "consistent": not missing and not orphaned,
+        "mongo_count": mongo_count,
+        "redis_count": redis_count,
+        "missing_from_redis": missing,
+        "orphaned_in_redis": orphaned,
+        "missing_sample": missing_sample,
+        "orphaned_sample": orphaned_sample,
+    }
@@ -1,3 +1,6 @@
+import asyncio
+import contextlib
+import logging
 from contextlib import asynccontextmanager
 from fastapi import FastAPI, Depends, Query
 from fastapi.middleware.cors import CORSMiddleware
@@ -6,6 +9,20 @@ from pymongo import AsyncMongoClient
 import redis.asyncio as Redis
 from bson import ObjectId
 
+from geo_index import GEO_KEY, warm_geo_index
+
+logger = logging.getLogger(__name__)
+
+
+def _log_geo_warmup(task: asyncio.Task) -> None:
+    if task.cancelled():
+        return
+    exc = task.exception()
+    if exc is not None:
+        logger.error("Warming up %s failed, the geo index may be empty", GEO_KEY, exc_info=exc)
+    elif task.result() is not None:
+        logger.info("Warmed up %s: %s", GEO_KEY, task.result())
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -16,9 +33,20 @@ async def lifespan(app: FastAPI):
     app.state.mongo_client = AsyncMongoClient("mongodb://mongodb:27017")
     app.state.db = app.state.mongo_client["spill"]
 
+    # Rebuild the geo index in the background if Redis lost it
+    app.state.geo_warmup_task = asyncio.create_task(
+        warm_geo_index(app.state.redis, app.state.db.spill)
+    )
+    app.state.geo_warmup_task.add_done_callback(_log_geo_warmup)
+
     try:
         yield
     finally:
+        app.state.geo_warmup_task.cancel()
+        # Let the rebuild clean up its temp key and lock before the clients
+        # close; a failure was already logged by _log_geo_warmup
+        with contextlib.suppress(asyncio.CancelledError, Exception):
+            await app.state.geo_warmup_task
         await app.state.redis.close()
         await app.state.mongo_client.close()
 
@@ -50,7 +78,7 @@ async def create_story(story: StoryCreateRequest):
 
     # Add geo index in Redis
     await app.state.redis.geoadd(
-        "stories_geo",
+        GEO_KEY,
         (story.longitude, story.latitude, story_id)  # Redis expects (lng, lat, member)
     )
 
@@ -65,7 +93,7 @@ async def get_stories(
 ):
     # Find nearby story IDs from Redis
     story_ids = await app.state.redis.georadius(
-        "stories_geo",
+        GEO_KEY,
         longitude,
         latitude,
         radius_km,
@@ -85,3 +113,4 @@ async def get_stories(
         stories.append(doc)
 
     return {"stories": stories}
+
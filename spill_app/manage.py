@@ -0,0 +1,65 @@
+"""
+Maintenance commands for the spill_app geo index.
+
+These scan the whole stories collection, so they are run by an operator
+rather than exposed over HTTP.
+
+Usage:
+    python manage.py rebuild-geo
+    python manage.py check-geo --sample-size 50
+"""
+import argparse
+import asyncio
+import json
+import sys
+from typing import Any, Dict, List
+
+import redis.asyncio as Redis
+from pymongo import AsyncMongoClient
+
+from geo_index import check_geo_consistency, rebuild_geo_index
+
+
+def parse_args(argv: List[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Maintain the spill_app Redis geo index")
+    parser.add_argument("--redis-url", default="redis://redis:6379")
+    parser.add_argument("--mongo-url", default="mongodb://mongodb:27017")
+    parser.add_argument("--mongo-db", default="spill")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    # Reload stories_geo from Mongo and swap it in atomically
+    commands.add_parser("rebuild-geo", help="Rebuild stories_geo from the stories collection")
+
+    # Report stories missing from, or orphaned in, the Redis geo index
+    check = commands.add_parser("check-geo", help="Report drift between Mongo and stories_geo")
+    check.add_argument("--sample-size", type=int, default=20, help="Max ids to list per drift bucket")
+    return parser.parse_args(argv)
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    redis = Redis.from_url(args.redis_url, decode_responses=True)
+    mongo_client = AsyncMongoClient(args.mongo_url)
+    collection = mongo_client[args.mongo_db].spill
+    try:
+        if args.command == "rebuild-geo":
+            return await rebuild_geo_index(redis, collection)
+        return await check_geo_consistency(redis, collection, args.sample_size)
+    finally:
+        await redis.close()
+        await mongo_client.close()
+
+
+def main(argv: List[str] | None = None) -> int:
+    args = parse_args(argv)
+    result = asyncio.run(run(args))
+    print(json.dumps(result, indent=2))
+
+    if result["status"] != "ok":
+        return 1
+    if args.command == "check-geo" and not result["consistent"]:
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())